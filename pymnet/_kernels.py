@@ -0,0 +1,90 @@
+"""Numerical kernels for the CSR snapshots of multilayer networks.
+
+The kernels are compiled with Numba if it is installed. Otherwise equivalent
+implementations using only NumPy are used.
+
+All kernels take the CSR snapshot of a network (indptr, indices, weights,
+see MultilayerNetwork._freeze) and an array pos giving for each node of the
+snapshot its position in the output matrix, or -1 if the node is left out.
+"""
+
+import numpy
+
+
+def _build_dense_numpy(indptr,indices,weights,pos,layer_of_node,intra_only,no_diagonal,out):
+    """Writes the links of a CSR snapshot to a dense matrix out.
+
+    If intra_only is True, only links between nodes with the same value in
+    layer_of_node are written. If no_diagonal is True, self-links are left out.
+    """
+    ids=numpy.repeat(numpy.arange(len(pos),dtype=numpy.int64),numpy.diff(indptr))
+    rows,cols=pos[ids],pos[indices]
+    keep=(rows>=0)&(cols>=0)
+    if no_diagonal:
+        keep&=rows!=cols
+    if intra_only:
+        keep&=layer_of_node[ids]==layer_of_node[indices]
+    out[rows[keep],cols[keep]]=weights[keep]
+
+def _modularity_dense_numpy(indptr,indices,weights,pos,strength,m_by_layer,layer_of_node,gamma,intra_only,out):
+    """Writes the modularity matrix of a CSR snapshot to a dense matrix out.
+
+    The element for nodes i and j is A_ij-gamma*k_i*k_j/(2*m_s) if both are in
+    layer s, and A_ij otherwise. Here k is given by strength, m_s by 
+    m_by_layer[s] and the layers of the nodes by layer_of_node. If intra_only
+    is True, the links between layers are left out.
+    """
+    _build_dense_numpy(indptr,indices,weights,pos,layer_of_node,intra_only,False,out)
+    for layer in range(len(m_by_layer)):
+        if m_by_layer[layer]!=0:
+            nodes=numpy.flatnonzero((layer_of_node==layer)&(pos>=0))
+            p=pos[nodes]
+            out[numpy.ix_(p,p)]-=gamma*numpy.outer(strength[nodes],strength[nodes])/(2.0*m_by_layer[layer])
+
+
+def _build_dense_loops(indptr,indices,weights,pos,layer_of_node,intra_only,no_diagonal,out):
+    """Version of _build_dense_numpy to be compiled with Numba.
+    """
+    for i in prange(len(pos)):
+        if pos[i]>=0:
+            for k in range(indptr[i],indptr[i+1]):
+                j=indices[k]
+                if pos[j]<0 or (no_diagonal and i==j) or (intra_only and layer_of_node[i]!=layer_of_node[j]):
+                    continue
+                out[pos[i],pos[j]]=weights[k]
+
+def _modularity_dense_loops(indptr,indices,weights,pos,strength,m_by_layer,layer_of_node,gamma,intra_only,out):
+    """Version of _modularity_dense_numpy to be compiled with Numba.
+    """
+    build_dense(indptr,indices,weights,pos,layer_of_node,intra_only,False,out)
+
+    #group the nodes by their layers
+    order=numpy.argsort(layer_of_node,kind="mergesort")
+    start=numpy.zeros(len(m_by_layer)+1,dtype=numpy.int64)
+    for i in range(len(pos)):
+        start[layer_of_node[i]+1]+=1
+    for layer in range(len(m_by_layer)):
+        start[layer+1]+=start[layer]
+
+    for a in prange(len(pos)):
+        i=order[a]
+        layer=layer_of_node[i]
+        if pos[i]>=0 and m_by_layer[layer]!=0:
+            c=gamma*strength[i]/(2.0*m_by_layer[layer])
+            for b in range(start[layer],start[layer+1]):
+                j=order[b]
+                if pos[j]>=0:
+                    out[pos[i],pos[j]]-=c*strength[j]
+
+
+try:
+    import numba
+    from numba import prange
+    build_dense=numba.njit("void(int64[::1],int64[::1],float64[::1],int64[::1],int64[::1],boolean,boolean,float64[:,::1])",
+                           cache=True,parallel=True)(_build_dense_loops)
+    modularity_dense=numba.njit("void(int64[::1],int64[::1],float64[::1],int64[::1],float64[::1],float64[::1],int64[::1],float64,boolean,float64[:,::1])",
+                                cache=True,parallel=True)(_modularity_dense_loops)
+except ImportError: #in case numba is not installed
+    build_dense=_build_dense_numpy
+    modularity_dense=_modularity_dense_numpy
+
@@ -1,7 +1,7 @@
 """Clustering coefficients in multiplex networks.
 """
 
-import itertools
+import itertools,numbers
 from .net import MultiplexNetwork
 from . import transforms
 
@@ -93,17 +93,34 @@ def gcc_zhang(net):
 
     """
 
+    def add_batch(nom,den,nijs,links):
+        if isinstance(net.noEdge,numbers.Number):
+            ijs=net._get_links_batch(links).tolist()
+        else:
+            ijs=[net[link] for link in links]
+        for nij,ij in zip(nijs,ijs):
+            den+=nij
+            if ij!=net.noEdge:
+                nom+=nij*ij
+        return nom,den
+
     maxw=max(map(lambda x:x[2],net.edges))
     nom,den=0,0
+    #the weights of the links between the neighbors are queried in batches,
+    #so that the memory use doesn't grow with the squares of the degrees
+    nijs,links=[],[]
     for node in net:
-        degree=net[node].deg()
-        if degree>=2:
-            for i,j in itertools.combinations(net[node],2):
-                nij=net[node][i]*net[node][j]
-                ij=net[i][j]
-                den+=nij            
-                if ij!=net.noEdge:
-                    nom+=nij*ij
+        w=dict((i,net[node][i]) for i in net[node])
+        pairs=itertools.combinations(w,2)
+        batch=list(itertools.islice(pairs,2**16))
+        while len(batch)!=0:
+            nijs.extend([w[i]*w[j] for i,j in batch])
+            links.extend(batch)
+            if len(links)>=2**16:
+                nom,den=add_batch(nom,den,nijs,links)
+                nijs,links=[],[]
+            batch=list(itertools.islice(pairs,2**16))
+    nom,den=add_batch(nom,den,nijs,links)
     if den!=0:
         return nom/float(den)/float(maxw)
     else:
@@ -640,6 +657,7 @@ def cc_cycle_vector_adj(net,node,layer):
 
     assert nodes1==nodes2
 
+    adj,a=numpy.matrix(adj),numpy.matrix(a)
     c=adj-a
 
     ch=c+numpy.eye(len(c))
@@ -664,6 +682,7 @@ def cc_cycle_vector_adj(net,node,layer):
 
     fn=get_full_multiplex_network(net.slices[0],net.slices[1])
     f,node3=fn.get_supra_adjacency_matrix(includeCouplings=False)
+    f=numpy.matrix(f)
     afa=(a*f*a)[node,node]
     afcac=(a*f*c*a*c)[node,node]
     acfac=(a*c*f*a*c)[node,node]
@@ -693,10 +712,12 @@ def gcc_aw_vector_adj(net):
     import numpy
     adj,nodes1=net.get_supra_adjacency_matrix()    
     a,nodes2=net.get_supra_adjacency_matrix(includeCouplings=False)
+    adj,a=numpy.matrix(adj),numpy.matrix(a)
     c=adj-a
 
     fn=get_full_multiplex_network(net.slices[0],net.slices[1])
     f,node3=fn.get_supra_adjacency_matrix(includeCouplings=False)
+    f=numpy.matrix(f)
 
     aaa=a*a*a
     afa=a*f*a
@@ -1140,6 +1161,7 @@ def gcc_vector_moreno(net):
     import numpy
     adj,nodes1=net.get_supra_adjacency_matrix()    
     a,nodes2=net.get_supra_adjacency_matrix(includeCouplings=False)
+    adj,a=numpy.matrix(adj),numpy.matrix(a)
     c=adj-a
 
     aaa=a*a*a
@@ -1183,10 +1205,12 @@ def gcc_vector_moreno2(net):
     import numpy
     adj,nodes1=net.get_supra_adjacency_matrix()    
     a,nodes2=net.get_supra_adjacency_matrix(includeCouplings=False)
+    adj,a=numpy.matrix(adj),numpy.matrix(a)
     c=adj-a
 
     fn=get_full_multiplex_network(net.slices[0],net.slices[1])
     f,node3=fn.get_supra_adjacency_matrix(includeCouplings=False)
+    f=numpy.matrix(f)
 
     aaa=a*a*a
     afa=a*f*a
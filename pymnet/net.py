@@ -1,12 +1,55 @@
 """Data structures for handling various forms of multilayer networks.
 """
 
-import math,itertools,pickle,collections
+import itertools,pickle,collections,operator
 import pymnet.transforms as transforms
 
 COLON=slice(None,None,None)
 
 
+def _tuple_getter(indices):
+    """Returns a function that picks the elements at given indices of a 
+    tuple and returns them as a new tuple.
+    """
+    indices=tuple(indices)
+    if len(indices)==1: #itemgetter would return the element itself
+        return operator.itemgetter(slice(indices[0],indices[0]+1))
+    return operator.itemgetter(*indices)
+
+def _link_builder(d):
+    """Returns a function that builds the link (i,j,s_1,r_1, ... ,s_d,r_d) from
+    the nodes (i,s_1,...,s_d) and (j,r_1,...,r_d) of d elements.
+
+    The function is generated for each d, so that it picks the elements 
+    without looping. It cannot be pickled in a process where it has not been
+    generated yet, so it is never part of the pickled state of a network but
+    rebuilt when the network is loaded.
+    """
+    name="_nodes_to_link_%d"%d
+    if name not in globals():
+        elements="".join("a[%d],b[%d],"%(i,i) for i in range(d))
+        exec("def %s(a,b):\n    return (%s)\n"%(name,elements),globals())
+    return globals()[name]
+
+def _filter_nodes(nodes,dims):
+    """Iterates over nodes which have exactly the same value as dims at 
+    each dimension where dims is not None.
+    """
+    constraints=[(i,val) for i,val in enumerate(dims) if val!=None]
+    if len(constraints)==1:
+        i,val=constraints[0]
+        for node in nodes:
+            if node[i]==val:
+                yield node
+    else:
+        for node in nodes:
+            for i,val in constraints:
+                if node[i]!=val:
+                    break
+            else:
+                yield node
+
+
 class MultilayerNetwork(object):
     """General multilayer network with a tensor-like interface.
 
@@ -48,6 +91,12 @@ class MultilayerNetwork(object):
     fullyInterconnected : bool
        Determines if the network is fully interconnected, i.e. all nodes
        are shared between all layers. Ignored if aspects==0.
+    dtype : numpy floating point type or None
+       Type of the link weights in the array snapshot of the network used 
+       by the matrix methods. None is numpy.float64. For large networks
+       numpy.float32 can be used to halve the memory used by the weights.
+       Only the supra-adjacency matrices then have reduced precision, other
+       methods use the exact weights.
 
     Notes
     -----
@@ -67,17 +116,27 @@ class MultilayerNetwork(object):
     MultiplexNetwork : A class for multiplex networks
 
     """
+    __slots__=('aspects','directed','noEdge','fullyInterconnected','slices',
+               '_net','_rnet','_totalDegree','_layerToNodes','_nodeToLayers',
+               '_node2id','_indptr','_indices','_weights','_dtype',
+               '_to_n1','_to_n2','_to_link','_to_full_link')
+    #not pickled, the link getters and the CSR snapshot are rebuilt when needed
+    _transient=('_to_n1','_to_n2','_to_link','_to_full_link',
+                '_node2id','_indptr','_indices','_weights')
+
     def __init__(self,
                  aspects=0,
                  noEdge=0,
                  directed=False,
-                 fullyInterconnected=True):
+                 fullyInterconnected=True,
+                 dtype=None):
         assert aspects>=0
 
         self.aspects=aspects
         self.directed=directed
         self.noEdge=noEdge
         self._init_slices(aspects)
+        self._init_link_getters()
         if aspects==0:
             fullyInterconnected=True
         self.fullyInterconnected=fullyInterconnected
@@ -86,6 +145,8 @@ class MultilayerNetwork(object):
 
         #Private variables for the state of the object
         self._net={}
+        self._indptr=None #CSR snapshot of self._net, built lazily by _freeze
+        self._dtype=dtype
 
         if not fullyInterconnected:
             self._layerToNodes={} #key=layer,val=set of nodes
@@ -123,37 +184,37 @@ class MultilayerNetwork(object):
             self.slices.append(set())
        
         
-    #@classmehtod
+    def _init_link_getters(self):
+        """Precomputes the index permutations used by _link_to_nodes,
+        _nodes_to_link and _short_link_to_link.
+        """
+        d=self.aspects+1
+        self._to_n1=_tuple_getter(range(0,2*d,2))
+        self._to_n2=_tuple_getter(range(1,2*d,2))
+        self._to_link=_link_builder(d)
+        self._to_full_link=_tuple_getter([0,1]+[i for i in range(2,d+1) for k in (0,1)])
+
     def _link_to_nodes(self,link):
         """Returns the link as tuple of nodes in the graph representing
         the multislice structure. I.e. when given (i,j,s_1,r_1, ... ,s_d,r_d)
         (i,s_1,...,s_d),(j,r_1,...,r_d) is returned.
         """
-        return (link[0],)+link[2::2],(link[1],)+link[3::2]
-    #@classmehtod
+        return self._to_n1(link),self._to_n2(link)
+
     def _nodes_to_link(self,node1,node2):
         """Returns a link when tuple of nodes is given in the graph representing
         the multislice structure. I.e. when given (i,s_1,...,s_d),(j,r_1,...,r_d) 
         (i,j,s_1,r_1, ... ,s_d,r_d) is returned.
         """
-        assert len(node1)==len(node2)
-        l=[]
-        for i,n1 in enumerate(node1):
-            l.append(n1)
-            l.append(node2[i])
-        return tuple(l)
-    #@classmehtod
+        assert len(node1)==len(node2)==self.aspects+1
+        return self._to_link(node1,node2)
+
     def _short_link_to_link(self,slink):
         """ Returns a full link for the shortened version of the link. That is,
         if (i,j,s_1,...,s_d) is given as input, then (i,j,s_1,s_1,...,s_d,s_d) is 
         returned.
         """
-        l=list(slink[:2])
-        for k in slink[2:]:
-            l.append(k)
-            l.append(k)
-
-        return tuple(l)
+        return self._to_full_link(slink)
     
     def __len__(self):
         return len(self.slices[0])
@@ -252,6 +313,7 @@ class MultilayerNetwork(object):
     def _set_link(self,link,value):
         #keep track of nodes and layers in net?
         node1,node2=self._link_to_nodes(link)
+        self._indptr=None #the CSR snapshot is out of date
         if value==self.noEdge:
             if node1 in self._net:
                 if node2 in self._net[node1]:
@@ -367,11 +429,13 @@ class MultilayerNetwork(object):
 
     def _get_strength_in_dir(self,node, dims=None):
         """Private method returning nodes in-strenght."""
-        return sum(map(lambda n:self._get_link(self._nodes_to_link(n,node)),self._iter_neighbors_in(node,dims)))
+        return sum([self._get_link(self._nodes_to_link(n,node)) for n in self._iter_neighbors_in(node,dims)])
 
     def _get_strength_out(self,node, dims=None):
         """Private method returning nodes out-strenght."""
-        return sum(map(lambda n:self._get_link(self._nodes_to_link(node,n)),self._iter_neighbors_out(node,dims)))
+        if dims is None and node in self._net: #weights are stored in self._net
+            return sum(self._net[node].values())
+        return sum([self._get_link(self._nodes_to_link(node,n)) for n in self._iter_neighbors_out(node,dims)])
 
     def _get_strength_total_dir(self,node, dims=None):
         """Private method returning nodes total strenght (sum of in- and out-strength)."""
@@ -412,9 +476,8 @@ class MultilayerNetwork(object):
                 for neigh in self._net[node]:
                     yield neigh
             else:
-                for neigh in self._net[node]:
-                    if all(map(lambda i:dims[i]==None or neigh[i]==dims[i], range(len(dims)))):
-                        yield neigh
+                for neigh in _filter_nodes(self._net[node],dims):
+                    yield neigh
 
     def _iter_neighbors_in_dir(self,node,dims=None):
         """Iterate over out-neighbors of a node in a directed network."""
@@ -423,9 +486,8 @@ class MultilayerNetwork(object):
                 for neigh in self._rnet[node]:
                     yield neigh
             else:
-                for neigh in self._rnet[node]:
-                    if all(map(lambda i:dims[i]==None or neigh[i]==dims[i], range(len(dims)))):
-                        yield neigh
+                for neigh in _filter_nodes(self._rnet[node],dims):
+                    yield neigh
 
     def _iter_neighbors_total_dir(self,node,dims=None):
         """Iterate over in- and out-neighbors of a node in a directed network."""
@@ -472,25 +534,25 @@ class MultilayerNetwork(object):
 
         """        
         d=self.aspects+1
-        if not item.__class__==tuple:
+        if type(item) is not tuple:
             item=(item,)
-        if len(item)==d: #node
-            return MultilayerNode(item,self)
-        elif len(item)==2*d: #link, or a node if slicing
-            colons=0
+        l=len(item)
+        if l==2*d: #link, or a node if slicing
+            if COLON not in item[1::2]: #fast path for links
+                return self._get_link(item)
             layers=[]
             for i in range(d):
                 if item[2*i+1]!=COLON:
                     layers.append(item[2*i])
                 else:
-                    colons+=1
                     layers.append(None)
-            if colons>0:
-                return MultilayerNode(self._link_to_nodes(item)[0],self,layers=layers)
-            else:
-                return self._get_link(item)
-        elif len(item)==d+1: #interslice link or node if slicing            
+            return MultilayerNode(self._link_to_nodes(item)[0],self,layers=layers)
+        elif l==d: #node
+            return MultilayerNode(item,self)
+        elif l==d+1: #interslice link or node if slicing
             if COLON not in item[2:]: #check if colons are in the slice indices
+                if item[1] is not COLON:
+                    return self._get_link(self._short_link_to_link(item))
                 return self[self._short_link_to_link(item)]
             else:
                 raise Exception("Not implemented.")
@@ -503,7 +565,7 @@ class MultilayerNetwork(object):
     def __setitem__(self,item,val):
         d=self.aspects+1
 
-        if not item.__class__==tuple:
+        if type(item) is not tuple:
             item=(item,)
         if len(item)==2*d:
             link=item
@@ -514,9 +576,10 @@ class MultilayerNetwork(object):
             raise KeyError("Invalid number of indices.")
 
         #There might be new nodes, add them to sets of nodes
+        add_layer=self.add_layer
         if self.fullyInterconnected:
-            for i in range(2):
-                self.add_layer(link[i],int(math.floor(i/2))) #just d/2 would work, but ugly
+            add_layer(link[0],0)
+            add_layer(link[1],0)
         else:
             if self.aspects==1:
                 self.add_node(link[0],layer=link[2])
@@ -527,7 +590,7 @@ class MultilayerNetwork(object):
                 self.add_node(n2[0],layer=n2[1:])
 
         for i in range(2,2*d):
-            self.add_layer(link[i],int(math.floor(i/2))) #just d/2 would work, but ugly
+            add_layer(link[i],i>>1) #link[i] is a layer in aspect i//2
 
 
         self._set_link(link,val)
@@ -562,7 +625,7 @@ class MultilayerNetwork(object):
         """ Iterate over all node-layer pairs.
         """
         if self.fullyInterconnected:
-            for nl in itertools.product(*map(lambda i:self.slices[i],range(len(self.slices)))):
+            for nl in itertools.product(*self.slices):
                 yield nl
         else:
             if self.aspects==1:
@@ -589,16 +652,26 @@ class MultilayerNetwork(object):
                 yield l
         else:
             if self.aspects>1:
-                for l in itertools.product(*map(lambda i:self.slices[i],range(1,len(self.slices)))):
+                for l in itertools.product(*self.slices[1:]):
                     yield l
             elif self.aspects==1:
                 for l in self.slices[1]:
                     yield l
 
     def _write_flattened(self,output):
-        nodes=map(lambda x: tuple(reversed(x)),sorted(itertools.product(*map(lambda i:sorted(self.slices[i]),reversed(range(len(self.slices)))))))
-        for i in nodes:
-            row=[str(self[i][j]) for j in nodes]
+        """Writes the supra-adjacency matrix, including the self-links, to 
+        the output as rows of space separated values and closes the output.
+        """
+        nodes=sorted(itertools.product(*self.slices),key=lambda x:tuple(reversed(x)))
+        index=dict((node,i) for i,node in enumerate(nodes))
+        #the rows are filled from the adjacency structure, and the weights are
+        #written as str() gives them for their own types
+        rows=[[str(self.noEdge)]*len(nodes) for node in nodes]
+        for node,neighbors in self._iter_adjacency():
+            row=rows[index[node]]
+            for neigh,w in neighbors.items():
+                row[index[neigh]]=str(w)
+        for row in rows:
             output.write(" ".join(row)+"\n")
         output.close()
 
@@ -606,6 +679,76 @@ class MultilayerNetwork(object):
     def __hash__(self):
         return pickle.dumps(self).__hash__()
 
+    def __getstate__(self):
+        """Returns the attributes of the network for pickling.
+
+        The attributes are collected explicitly because the class uses
+        __slots__, which also makes pickling with protocols 0 and 1 work.
+        The link getters and the CSR snapshot are left out, so that the
+        pickle (and the hash) doesn't depend on whether the snapshot has 
+        been built.
+        """
+        state={}
+        for cls in type(self).__mro__:
+            for name in cls.__dict__.get('__slots__',()):
+                if name not in self._transient and hasattr(self,name):
+                    state[name]=getattr(self,name)
+        if hasattr(self,'__dict__'): #subclasses without __slots__
+            state.update(self.__dict__)
+        return state
+
+    def __setstate__(self,state):
+        for name,value in state.items():
+            setattr(self,name,value)
+        if '_indptr' not in state:
+            self._indptr=None
+        if '_dtype' not in state: #pickled before the dtype option
+            self._dtype=None
+        self._init_link_getters()
+
+    def _iter_adjacency(self):
+        """Iterates over the rows of the adjacency structure of the graph
+        representing the multislice structure.
+
+        Yields tuples (node,neighbors) where neighbors is a dict with neighbors
+        of the node as keys and link weights as values. Every neighbor must
+        also be yielded as a node.
+        """
+        return iter(self._net.items())
+
+    def _freeze(self):
+        """Builds a compressed sparse row (CSR) snapshot of the network.
+
+        After calling this method self._node2id maps each node (i,s_1,...,s_d)
+        of the graph representing the multislice structure to an integer id,
+        and the out-neighbors of a node with id i are stored in 
+        self._indices[self._indptr[i]:self._indptr[i+1]] in increasing order,
+        with the corresponding link weights in self._weights. The snapshot is 
+        built only on the first call after the network has been modified, and
+        all link weights must be numeric. The weights are of type given by the
+        dtype parameter of the constructor, float64 by default.
+        """
+        if self._indptr is not None:
+            return
+        import numpy
+        rows=[(node,neighbors) for node,neighbors in self._iter_adjacency()]
+        self._node2id=dict((node,i) for i,(node,neighbors) in enumerate(rows))
+        n=len(rows)
+
+        degs=numpy.fromiter((len(neighbors) for node,neighbors in rows),dtype=numpy.int64,count=n)
+        indptr=numpy.zeros(n+1,dtype=numpy.int64)
+        numpy.cumsum(degs,out=indptr[1:])
+        nnz=int(indptr[-1])
+        indices=numpy.fromiter((self._node2id[neigh] for node,neighbors in rows for neigh in neighbors),dtype=numpy.int64,count=nnz)
+        dtype=numpy.float64 if self._dtype is None else self._dtype
+        weights=numpy.fromiter((w for node,neighbors in rows for w in neighbors.values()),dtype=dtype,count=nnz)
+
+        #sort the neighbors of each node by their ids
+        order=numpy.lexsort((indices,numpy.repeat(numpy.arange(n,dtype=numpy.int64),degs)))
+        self._indices=indices[order]
+        self._weights=weights[order]
+        self._indptr=indptr
+
     def get_supra_adjacency_matrix(self,includeCouplings=True):
         """Returns the supra-adjacency matrix and a list of node-layer pairs.
 
@@ -617,27 +760,122 @@ class MultilayerNetwork(object):
 
         Returns
         -------
-        matrix, nodes : numpy.matrix, list
+        matrix, nodes : numpy.ndarray, list
            The supra-adjacency matrix and the list of node-layer pairs. The order
            of the elements in the list and the supra-adjacency matrix are the same.
         """
         import numpy
+        from pymnet import _kernels
+        self._freeze()
+        nodes,pos=self._get_supra_positions()
+        layers={}
+        layer_of_node=numpy.fromiter((layers.setdefault(node[1:],len(layers)) for node in self._node2id),dtype=numpy.int64,count=len(pos))
+
+        matrix=self._init_supra_matrix(nodes,includeCouplings,self.noEdge)
+        _kernels.build_dense(self._indptr,self._indices,self._weights.astype(numpy.float64,copy=False),pos,layer_of_node,not includeCouplings,self.aspects==0,matrix)
+        return matrix,nodes
+
+    def _init_supra_matrix(self,nodes,includeCouplings,noEdge):
+        """Returns a supra-adjacency matrix for the node-layer pairs filled 
+        with noEdge, except for the diagonal of monoplex networks and the 
+        inter-layer elements when includeCouplings is False, which are 0.
+        """
+        import numpy
+        matrix=numpy.full((len(nodes),len(nodes)),noEdge,dtype=float)
+        if noEdge!=0:
+            if self.aspects==0:
+                numpy.fill_diagonal(matrix,0)
+            elif not includeCouplings:
+                layers={}
+                layer=numpy.array([layers.setdefault(node[1:],len(layers)) for node in nodes],dtype=numpy.int64)
+                matrix[layer[:,None]!=layer[None,:]]=0
+        return matrix
+
+    def _get_supra_positions(self):
+        """Returns the list of node-layer pairs in the order of the rows of the
+        supra-adjacency matrix, and an array giving the row of each node of
+        the CSR snapshot (see _freeze), or -1 if it has no row.
+        """
+        import numpy
         if self.aspects>0:
-            nodes=list(map(lambda x: tuple(reversed(x)),sorted(itertools.product(*map(lambda i:sorted(self.slices[i]),reversed(range(len(self.slices))))))))
-            matrix=numpy.zeros((len(nodes),len(nodes)),dtype=float)
-            for i_index,i in enumerate(nodes):
-                for j_index,j in enumerate(nodes):
-                    if includeCouplings or i[1:]==j[1:]:
-                        matrix[i_index,j_index]=self[i][j]
+            nodes=sorted(itertools.product(*self.slices),key=lambda x:tuple(reversed(x)))
+            index=dict((node,i) for i,node in enumerate(nodes))
         else:
             nodes=sorted(self)
-            matrix=numpy.zeros((len(nodes),len(nodes)),dtype=float)
-            for i_index,i in enumerate(nodes):
-                for j_index,j in enumerate(nodes):
-                    if i_index!=j_index:
-                        matrix[i_index,j_index]=self[i][j]
+            index=dict(((node,),i) for i,node in enumerate(nodes))
+        pos=numpy.fromiter((index.get(node,-1) for node in self._node2id),dtype=numpy.int64,count=len(self._node2id))
+        return nodes,pos
+
+    def _links_to_ids(self,links):
+        """Returns arrays of the ids in the CSR snapshot (see _freeze) of the 
+        source and target nodes of the links, with -1 for nodes not in the 
+        snapshot.
+        """
+        import numpy
+        get=self._node2id.get
+        src=numpy.fromiter((get(self._to_n1(link),-1) for link in links),dtype=numpy.int64,count=len(links))
+        dst=numpy.fromiter((get(self._to_n2(link),-1) for link in links),dtype=numpy.int64,count=len(links))
+        return src,dst
+
+    def _get_links_batch(self,links):
+        """Returns the weights of a sequence of links as an array.
+
+        The links are given in the same format as for _get_link, and the 
+        weights are looked up from the CSR snapshot of the network all at once.
+        Missing links have weight self.noEdge, which must be numeric.
+
+        Building the snapshot takes time proportional to the size of the 
+        network. The snapshot of a MultilayerNetwork is reused until the 
+        network is modified, but MultiplexNetwork rebuilds it on every call,
+        so for multiplex networks this pays off only for batches that are
+        large compared to the network.
+
+        Parameters
+        ----------
+        links : sequence of tuples (i,j,s_1,r_1, ... ,s_d,r_d)
 
-        return numpy.matrix(matrix),nodes
+        Returns
+        -------
+        weights : numpy.ndarray
+        """
+        import numpy
+        links=list(links)
+        self._freeze()
+        src,dst=self._links_to_ids(links)
+        weights=numpy.full(len(links),self.noEdge,dtype=numpy.float64)
+        nnz=len(self._indices)
+        if nnz==0:
+            return weights
+
+        #rows are in increasing order and the neighbors are sorted within 
+        #each row, so the (row,neighbor) pairs encoded as row*n+neighbor
+        #are sorted and can be searched all at once
+        n=len(self._node2id)
+        keys=numpy.repeat(numpy.arange(n,dtype=numpy.int64),numpy.diff(self._indptr))*n+self._indices
+        queries=src*n+dst
+        pos=numpy.minimum(numpy.searchsorted(keys,queries),nnz-1)
+        found=(src>=0)&(dst>=0)&(keys[pos]==queries)
+        if self._weights.dtype==numpy.float64:
+            weights[found]=self._weights[pos[found]]
+        else: #reduced precision in the snapshot, so the exact weights are read
+            weights[found]=[self._get_link(links[k]) for k in numpy.flatnonzero(found)]
+        return weights
+
+    def _get_exact_weights(self):
+        """Returns the link weights of the CSR snapshot (see _freeze) as a 
+        float64 array. If the snapshot has a reduced dtype, the weights are
+        read from the network so that they are exact.
+        """
+        import numpy
+        self._freeze()
+        if self._weights.dtype==numpy.float64:
+            return self._weights
+        nodes=[None]*len(self._node2id)
+        for node,i in self._node2id.items():
+            nodes[i]=node
+        ids=numpy.repeat(numpy.arange(len(nodes),dtype=numpy.int64),numpy.diff(self._indptr))
+        links=(self._nodes_to_link(nodes[i],nodes[j]) for i,j in zip(ids.tolist(),self._indices.tolist()))
+        return numpy.fromiter((self._get_link(link) for link in links),dtype=numpy.float64,count=len(self._indices))
 
 class MultilayerNode(object):
     """A node in a MultilayerNetwork. 
@@ -647,6 +885,8 @@ class MultilayerNode(object):
     the neighboring edges can be iterated over by iterating the node, and the object
     contains methods for asking degree and strength of the node.
     """
+    __slots__=('node','mnet','layers')
+
     #net[1,'a','x'][:,:,'y']=net[1,:,'a',:,'x','y']
     def __init__(self,node,mnet,layers=None):
         """A node in multilayer network. 
@@ -739,9 +979,6 @@ class MultilayerNode(object):
     def __iter__(self):
         return self.iter_total()
 
-    def layers(self,*layers):
-        return MultilayerNode(self.node,self.mnet,layers=layers)
-
     def iter_total(self):
         for node in self._iter_nodes(self.mnet._iter_neighbors_total):
             yield node
@@ -770,23 +1007,20 @@ class MultilayerEdges:
 
     def __iter__(self):
         """Edge iterator.
+
+        In undirected networks each edge is iterated over only once.
         """
-        if self.net.directed:
-            for node in itertools.product(*self.net.slices):
-                for neigh in self.net[node].iter_out():                
-                    if self.net.aspects==0:
-                        neigh=(neigh,)
-                    link=self.net._nodes_to_link(node,neigh)
-                    yield link+(self.net[link],)
+        net=self.net
+        if net.directed:
+            for node,neighbors in net._iter_adjacency():
+                for neigh,w in neighbors.items():
+                    yield net._nodes_to_link(node,neigh)+(w,)
         else:
-            iterated=set()
-            for node in itertools.product(*self.net.slices):
-                for neigh in self.net[node]:                
-                    if self.net.aspects==0:
-                        neigh=(neigh,)
+            iterated=set() #nodes whose edges have already been iterated over
+            for node,neighbors in net._iter_adjacency():
+                for neigh,w in neighbors.items():
                     if neigh not in iterated:
-                        link=self.net._nodes_to_link(node,neigh)
-                        yield link+(self.net[link],)            
+                        yield net._nodes_to_link(node,neigh)+(w,)
                 iterated.add(node)
 
     def __len__(self):
@@ -808,22 +1042,56 @@ MultilayerNetwork.edges=property(MultilayerEdges)
 
 
 class MultiplexIntraNetDict(collections.MutableMapping):
+    """Intra-layer networks of a multiplex network, keyed by the layers.
+
+    The intra-layer networks are created only when they are first accessed,
+    so empty layers don't take any memory. Internally the networks are keyed
+    by layer tuples also when there is only one aspect.
+    """
     def __init__(self,net):
         self._net=net
         self._dict={}
+    def _to_tuple(self,key):
+        """Returns the key as a layer tuple, or None if it is not a tuple or
+        a list of layers.
+        """
+        if self._net.aspects==1:
+            return (key,)
+        if isinstance(key,(tuple,list)): #e.g. strings are not split into layers
+            return tuple(key)
+        return None
     def __getitem__(self,key):
-        return self._dict[key]
+        layer=self._to_tuple(key)
+        net=self._dict.get(layer)
+        if net is not None:
+            return net
+        if key in self:
+            return self._add_empty_network(layer)
+        raise KeyError(key)
+    def __contains__(self,key):
+        layer=self._to_tuple(key)
+        if layer is None:
+            return False
+        if layer in self._dict:
+            return True
+        slices=self._net.slices
+        return len(layer)==self._net.aspects and all(l in slices[a+1] for a,l in enumerate(layer))
     def __iter__(self):
-        return self._dict.__iter__()
+        if self._net.aspects==1:
+            return iter(self._net.slices[1])
+        return itertools.product(*self._net.slices[1:])
     def __len__(self):
-        return len(self._dict)
+        n=1
+        for s in self._net.slices[1:]:
+            n*=len(s)
+        return n
     
     def __setitem__(self,key,val):
         assert isinstance(val,MultilayerNetwork), "Invalid type of intra-layer network."
         assert val.aspects==0, "Intra-layer networks need to be monoplex networks."
         
-        if key in self._dict:
-            self._add_empty_network(key)
+        if key in self:
+            self._add_empty_network(self._to_tuple(key))
             transforms.subnet(val,val,newNet=self[key]) #copy the val to the layer
         else:
             raise Exception("No layer: "+str(key))
@@ -832,18 +1100,20 @@ class MultiplexIntraNetDict(collections.MutableMapping):
         pass
 
     def _add_empty_network(self,layer):
+        """Adds an empty network for the layer given as tuple and returns it.
+        """
         net=MultilayerNetworkWithParent(aspects=0,directed=self._net.directed)
         net._set_parent(self._net)
         if not self._net.fullyInterconnected:
-            if self._net.aspects==1:
-                net._set_name((layer,))
-            else:
-                net._set_name(layer)
+            net._set_name(layer)
         self._dict[layer]=net
+        return net
 
 
 
 class MultilayerNetworkWithParent(MultilayerNetwork):
+    __slots__=('parent','_name','_layer')
+
     def _set_parent(self,parent):
         self.parent=parent
         if parent.fullyInterconnected:
@@ -892,6 +1162,9 @@ class MultiplexNetwork(MultilayerNetwork):
     fullyInterconnected : bool
        Determines if the network is fully interconnected, i.e. all nodes
        are shared between all layers.
+    dtype : numpy floating point type or None
+       Type of the link weights in the array snapshot of the network. See
+       MultilayerNetwork.
     
     Notes
     -----
@@ -908,9 +1181,10 @@ class MultiplexNetwork(MultilayerNetwork):
     """
 
 
-    def __init__(self,couplings=None,directed=False,noEdge=0,fullyInterconnected=True):
+    def __init__(self,couplings=None,directed=False,noEdge=0,fullyInterconnected=True,dtype=None):
         self.directed=directed
         self.noEdge=noEdge
+        self._dtype=dtype
 
         self.fullyInterconnected=fullyInterconnected
         if not fullyInterconnected:
@@ -945,31 +1219,64 @@ class MultiplexNetwork(MultilayerNetwork):
             raise ValueError("Invalid coupling type: "+str(type(couplings)))
 
         self._init_slices(self.aspects)
+        self._init_link_getters()
         
         #diagonal elements, map with keys as tuples of slices and vals as MultiSliceNetwork objects
         #keys are not tuples if dimensions==2
         self.intranets=MultiplexIntraNetDict(self)
         self.A=self.intranets
+        self._A_by_tuple=self.intranets._dict #created intra-layer nets keyed by layer tuples
 
         self._init_directions()
 
     def _get_edge_inter_aspects(self,link):
-        r"""Returns list of aspects where the two nodes of $G_M$ differ.
+        r"""Returns tuple of aspects where the two nodes of $G_M$ differ.
         """
         dims=[]
         for d in range(self.aspects+1):
             if link[2*d]!=link[2*d+1]:
                 dims.append(d)
-        return dims
+        return tuple(dims)
+
+    def __setstate__(self,state):
+        """Overrides parents method.
+
+        In networks pickled before the intra-layer networks were keyed by
+        layer tuples, the networks of single-aspect networks are keyed by the
+        layers themselves and _A_by_tuple is missing.
+        """
+        MultilayerNetwork.__setstate__(self,state)
+        if '_A_by_tuple' not in state:
+            if self.aspects==1:
+                self.intranets._dict=dict(((layer,),net) for layer,net in self.intranets._dict.items())
+            self._A_by_tuple=self.intranets._dict
 
     def _get_A_with_tuple(self,layer):
         """Return self.A. Layer must be given as tuple.
         """
+        net=self._A_by_tuple.get(layer)
+        if net is not None:
+            return net
         if self.aspects==1:
             return self.A[layer[0]]
         else:
             return self.A[layer]
 
+    def _peek_A_with_tuple(self,layer):
+        """Return self.A, or None if it has not been created yet. Layer must be
+        given as tuple.
+        """
+        return self._A_by_tuple.get(layer)
+
+    def _is_empty_intranet(self,net):
+        """Returns True if the intra-layer network is None or equal to one 
+        that has not been created yet, i.e., it has no links and, if the
+        network is not fully interconnected, no nodes.
+        """
+        if net is None:
+            return True
+        return len(net.edges)==0 and (self.fullyInterconnected or len(net.slices[0])==0)
+
     def add_layer(self,layer,aspect=1):
         """ Adds node or a layer to given aspect in the network.
 
@@ -979,17 +1286,8 @@ class MultiplexNetwork(MultilayerNetwork):
         """
         #overrrides the parent method
 
-        #check if new diagonal matrices needs to be added
+        #the intra-layer networks of the new layer are created when accessed
         if layer not in self.slices[aspect]:
-            if aspect>0:            
-                if self.aspects>1:
-                    new_slices=list(self.slices[1:])
-                    new_slices[aspect-1]=[layer]
-                    for s in itertools.product(*new_slices):
-                        self.A._add_empty_network(s)
-                else:
-                    self.A._add_empty_network(layer)
-
             if aspect==0:
                 self.add_node(layer)
             else:
@@ -1011,34 +1309,73 @@ class MultiplexNetwork(MultilayerNetwork):
         """Overrides parents method.
         """
         d=self._get_edge_inter_aspects(link)
-        if len(d)==1: #not a self-link, or link with multiple different cross-aspects
-            if d[0]>0:
-                assert link[0]==link[1]
-                if not link[0] in self.slices[0]:
-                    return self.noEdge
-                if not self.fullyInterconnected:
-                    supernode1, supernode2=self._link_to_nodes(link)
-                    if not (link[0] in self._get_A_with_tuple(supernode1[1:]).slices[0] and link[0] in self._get_A_with_tuple(supernode2[1:]).slices[0]):
-                        return self.noEdge
-                coupling=self.couplings[d[0]-1]                
-                if coupling[0]=="categorical":
-                        return coupling[1] 
-                elif coupling[0]=="ordinal":
-                    if link[2*d[0]]+1==link[2*d[0]+1] or link[2*d[0]]==link[2*d[0]+1]+1:
-                        return coupling[1]
-                    else:
-                        return self.noEdge
-                elif isinstance(coupling[0],MultilayerNetwork):
-                    return self.couplings[d[0]-1][0][link[2*d[0]],link[2*d[0]+1]]
-                else:
-                    raise Exception("Coupling not implemented: "+str(coupling))
+        if len(d)!=1: #a self-link, or link with multiple different cross-aspects
+            return self.noEdge
+        aspect=d[0]
+        if aspect==0: #intra-layer link
+            net=self._A_by_tuple.get(link[2::2])
+            if net is not None:
+                return net._get_link(link[:2])
             else:
-                if self._has_layer_with_tuple(link[2::2]):
-                    return self._get_A_with_tuple(link[2::2])[link[0],link[1]]
-                else:
-                    return self.noEdge
-        else:
+                return self.noEdge
+
+        assert link[0]==link[1]
+        if not link[0] in self.slices[0]:
             return self.noEdge
+        if not self.fullyInterconnected:
+            net1,net2=self._A_by_tuple.get(link[2::2]),self._A_by_tuple.get(link[3::2])
+            if net1 is None or net2 is None or not (link[0] in net1.slices[0] and link[0] in net2.slices[0]):
+                return self.noEdge
+        coupling=self.couplings[aspect-1]
+        if coupling[0]=="categorical":
+            return coupling[1]
+        elif coupling[0]=="ordinal":
+            if link[2*aspect]+1==link[2*aspect+1] or link[2*aspect]==link[2*aspect+1]+1:
+                return coupling[1]
+            else:
+                return self.noEdge
+        elif isinstance(coupling[0],MultilayerNetwork):
+            return coupling[0][link[2*aspect],link[2*aspect+1]]
+        else:
+            raise Exception("Coupling not implemented: "+str(coupling))
+
+    def _iter_adjacency(self):
+        """Overrides parents method.
+        """
+        for node in itertools.product(*self.slices):
+            net=self._peek_A_with_tuple(node[1:])
+            if net is not None:
+                candidates=[(n[0],)+node[1:] for n in net._iter_neighbors_out((node[0],))]
+            else:
+                candidates=[]
+            for aspect in range(1,self.aspects+1):
+                coupling_type=self.couplings[aspect-1][0]
+                if coupling_type=="categorical":
+                    layers=self.slices[aspect]
+                elif coupling_type=="ordinal":
+                    layers=(node[aspect]-1,node[aspect]+1)
+                elif isinstance(coupling_type,MultilayerNetwork):
+                    layers=coupling_type[node[aspect]].iter_out()
+                else:
+                    layers=()
+                for layer in layers:
+                    if layer!=node[aspect] and layer in self.slices[aspect]:
+                        candidates.append(node[:aspect]+(layer,)+node[aspect+1:])
+            neighbors={}
+            for neigh in candidates:
+                w=self._get_link(self._nodes_to_link(node,neigh))
+                if w!=self.noEdge:
+                    neighbors[neigh]=w
+            yield node,neighbors
+
+    def _freeze(self):
+        """Overrides parents method.
+
+        The coupling edges are generated on the fly, so the snapshot is
+        rebuilt on every call.
+        """
+        self._indptr=None
+        MultilayerNetwork._freeze(self)
                 
     def _set_link(self,link,value):
         """Overrides parents method.
@@ -1067,7 +1404,7 @@ class MultiplexNetwork(MultilayerNetwork):
                     if self.aspects==1:
                         return len(self._nodeToLayers[supernode[0]])-1
                     else:
-                        return len(filter(lambda x:x[aspect]==supernode[aspect],self._nodeToLayers[supernode[0]])) -1
+                        return sum(1 for x in self._nodeToLayers[supernode[0]] if x[:aspect-1]+x[aspect:]==layer[:aspect-1]+layer[aspect:]) -1
                 else:
                     return 0
         elif coupling_type=="ordinal":
@@ -1075,7 +1412,11 @@ class MultiplexNetwork(MultilayerNetwork):
             if self.fullyInterconnected:
                 return int(up in self.slices[aspect])+int(down in self.slices[aspect])
             else:
-                return int(supernode[:aspect]+(up,)+supernode[aspect+1:] in self._nodeToLayers[supernode[0]])+int(supernode[:aspect]+(down,)+supernode[aspect+1:] in self._nodeToLayers[supernode[0]])
+                layers=self._nodeToLayers.get(supernode[0],())
+                if self.aspects==1:
+                    return int(up in layers)+int(down in layers)
+                else:
+                    return int(supernode[1:aspect]+(up,)+supernode[aspect+1:] in layers)+int(supernode[1:aspect]+(down,)+supernode[aspect+1:] in layers)
         elif isinstance(coupling_type,MultilayerNetwork):
             if direction=="tot":
                 return self.couplings[aspect-1][0][supernode[aspect]].deg_total()
@@ -1103,14 +1444,18 @@ class MultiplexNetwork(MultilayerNetwork):
                 for n in self.slices[aspect]:
                     if n!=supernode[aspect]:                    
                         yield supernode[:aspect]+(n,)+supernode[aspect+1:]
-            elif supernode[0] in self._get_A_with_tuple(supernode[1:]).slices[0]:
-                for layers in self._nodeToLayers[supernode[0]]:
-                    if self.aspects>1:
-                        if layers!=supernode[1:]:
-                            yield (supernode[0],)+layers
-                    else:
-                        if layers!=supernode[1]:
-                            yield (supernode[0],layers)
+            else:
+                net=self._peek_A_with_tuple(supernode[1:])
+                if net is not None and supernode[0] in net.slices[0]:
+                    layer=supernode[1:]
+                    for layers in self._nodeToLayers[supernode[0]]:
+                        if self.aspects>1:
+                            #only the layers which differ in this aspect
+                            if layers[aspect-1]!=layer[aspect-1] and layers[:aspect-1]+layers[aspect:]==layer[:aspect-1]+layer[aspect:]:
+                                yield (supernode[0],)+layers
+                        else:
+                            if layers!=supernode[1]:
+                                yield (supernode[0],layers)
         elif coupling_type=="ordinal":
             up,down=supernode[aspect]+1,supernode[aspect]-1
             if self.fullyInterconnected:
@@ -1119,10 +1464,10 @@ class MultiplexNetwork(MultilayerNetwork):
                 if down in self.slices[aspect]:
                     yield supernode[:aspect]+(down,)+supernode[aspect+1:]
             else:
-                if supernode[1:aspect]+(up,)+supernode[aspect+1:] in self._nodeToLayers[supernode[0]]:
-                    yield supernode[:aspect]+(up,)+supernode[aspect+1:]
-                if supernode[1:aspect]+(down,)+supernode[aspect+1:] in self._nodeToLayers[supernode[0]]:
-                    yield supernode[:aspect]+(down,)+supernode[aspect+1:]
+                layers=self._nodeToLayers.get(supernode[0],())
+                for l in (up,down):
+                    if (l if self.aspects==1 else supernode[1:aspect]+(l,)+supernode[aspect+1:]) in layers:
+                        yield supernode[:aspect]+(l,)+supernode[aspect+1:]
         elif coupling_type=="none":
             pass
         else:
@@ -1130,17 +1475,11 @@ class MultiplexNetwork(MultilayerNetwork):
         
     def _select_dimensions(self,node,dims):
         if dims==None:
-            for d in range(self.aspects+1):
-                yield d
-        else:
-            l=[]
-            for d,val in enumerate(dims):
-                if val!=None and node[d]!=val:
-                    return
-                if val==None:
-                    l.append(d)
-            for d in l:
-                yield d
+            return range(self.aspects+1)
+        for d,val in enumerate(dims):
+            if val!=None and node[d]!=val:
+                return ()
+        return [d for d,val in enumerate(dims) if val==None]
 
     def _get_degree_total_dir(self,node, dims):
         """Overrides parents method.
@@ -1148,7 +1487,9 @@ class MultiplexNetwork(MultilayerNetwork):
         k=0
         for d in self._select_dimensions(node,dims):
             if d==0:
-                k+=self._get_A_with_tuple(node[1:])[node[0]].deg_total()
+                net=self._peek_A_with_tuple(node[1:])
+                if net is not None: #no links in layers not created yet
+                    k+=net[node[0]].deg_total()
             else:
                 k+=self._get_dim_degree(node,d,direction="tot")
         return k
@@ -1159,7 +1500,9 @@ class MultiplexNetwork(MultilayerNetwork):
         k=0
         for d in self._select_dimensions(node,dims):
             if d==0:
-                k+=self._get_A_with_tuple(node[1:])[node[0]].deg_in()
+                net=self._peek_A_with_tuple(node[1:])
+                if net is not None: #no links in layers not created yet
+                    k+=net[node[0]].deg_in()
             else:
                 k+=self._get_dim_degree(node,d,direction="in")
         return k
@@ -1170,7 +1513,9 @@ class MultiplexNetwork(MultilayerNetwork):
         k=0
         for d in self._select_dimensions(node,dims):
             if d==0:
-                k+=self._get_A_with_tuple(node[1:])[node[0]].deg_out()
+                net=self._peek_A_with_tuple(node[1:])
+                if net is not None: #no links in layers not created yet
+                    k+=net[node[0]].deg_out()
             else:
                 k+=self._get_dim_degree(node,d,direction="out")
         return k
@@ -1182,7 +1527,9 @@ class MultiplexNetwork(MultilayerNetwork):
         s=0
         for d in self._select_dimensions(node,dims):
             if d==0:
-                s+=self._get_A_with_tuple(node[1:])[node[0]].str_total()
+                net=self._peek_A_with_tuple(node[1:])
+                if net is not None: #no links in layers not created yet
+                    s+=net[node[0]].str_total()
             else:
                 s+=self._get_dim_strength(node,d,direction="tot")
         return s
@@ -1194,7 +1541,9 @@ class MultiplexNetwork(MultilayerNetwork):
         s=0
         for d in self._select_dimensions(node,dims):
             if d==0:
-                s+=self._get_A_with_tuple(node[1:])[node[0]].str_in()
+                net=self._peek_A_with_tuple(node[1:])
+                if net is not None: #no links in layers not created yet
+                    s+=net[node[0]].str_in()
             else:
                 s+=self._get_dim_strength(node,d,direction="in")
         return s
@@ -1206,7 +1555,9 @@ class MultiplexNetwork(MultilayerNetwork):
         s=0
         for d in self._select_dimensions(node,dims):
             if d==0:
-                s+=self._get_A_with_tuple(node[1:])[node[0]].str_out()
+                net=self._peek_A_with_tuple(node[1:])
+                if net is not None: #no links in layers not created yet
+                    s+=net[node[0]].str_out()
             else:
                 s+=self._get_dim_strength(node,d,direction="out")
         return s
@@ -1217,9 +1568,11 @@ class MultiplexNetwork(MultilayerNetwork):
         """Overrides parents method.
         """
         for d in self._select_dimensions(node,dims):
-            if d==0:                
-                for n in self._get_A_with_tuple(node[1:])._iter_neighbors_total((node[0],)):
-                    yield (n[0],)+node[1:]
+            if d==0:
+                net=self._peek_A_with_tuple(node[1:])
+                if net is not None: #no links in layers not created yet
+                    for n in net._iter_neighbors_total((node[0],)):
+                        yield (n[0],)+node[1:]
             else:
                 for n in self._iter_dim(node,d,direction="tot"):
                     yield n
@@ -1228,9 +1581,11 @@ class MultiplexNetwork(MultilayerNetwork):
         """Overrides parents method.
         """
         for d in self._select_dimensions(node,dims):
-            if d==0:                
-                for n in self._get_A_with_tuple(node[1:])._iter_neighbors_in((node[0],)):
-                    yield (n[0],)+node[1:]
+            if d==0:
+                net=self._peek_A_with_tuple(node[1:])
+                if net is not None: #no links in layers not created yet
+                    for n in net._iter_neighbors_in((node[0],)):
+                        yield (n[0],)+node[1:]
             else:
                 for n in self._iter_dim(node,d,direction="in"):
                     yield n
@@ -1239,9 +1594,11 @@ class MultiplexNetwork(MultilayerNetwork):
         """Overrides parents method.
         """
         for d in self._select_dimensions(node,dims):
-            if d==0:                
-                for n in self._get_A_with_tuple(node[1:])._iter_neighbors_out((node[0],)):
-                    yield (n[0],)+node[1:]
+            if d==0:
+                net=self._peek_A_with_tuple(node[1:])
+                if net is not None: #no links in layers not created yet
+                    for n in net._iter_neighbors_out((node[0],)):
+                        yield (n[0],)+node[1:]
             else:
                 for n in self._iter_dim(node,d,direction="out"):
                     yield n
@@ -1250,7 +1607,13 @@ class MultiplexNetwork(MultilayerNetwork):
         if type(self) is type(other):
             if self.directed == other.directed and self.directed==other.directed and self.aspects==other.aspects and self.fullyInterconnected == other.fullyInterconnected and self.noEdge == other.noEdge and self.slices==other.slices and self.couplings == other.couplings:
                 for layer in self.iter_layers():
-                    if self.A[layer]!=other.A[layer]:
+                    if self.aspects==1:
+                        layer=(layer,)
+                    net1,net2=self._peek_A_with_tuple(layer),other._peek_A_with_tuple(layer)
+                    if net1 is None or net2 is None: #compare without creating the missing network
+                        if not (self._is_empty_intranet(net1) and self._is_empty_intranet(net2)):
+                            return False
+                    elif net1!=net2:
                         return False
                 return True
         return False
@@ -1287,6 +1650,7 @@ class FlatMultilayerNetworkView(MultilayerNetwork):
     def __init__(self,mnet):
         self.mnet=mnet
         self.aspects=0
+        self._init_link_getters()
 
     def _flat_node_to_node(self,node):
         pass
@@ -1297,8 +1661,11 @@ class FlatMultilayerNetworkView(MultilayerNetwork):
 
     def _get_link(self,link):
         """Overrides parents method.
+
+        The nodes of the view are the nodes (i,s_1,...,s_d) of mnet, so
+        the link is converted to (i,j,s_1,r_1, ... ,s_d,r_d).
         """
-        return self.mnet[tuple(itertools.chain(*zip(*a)))]
+        return self.mnet._get_link(self.mnet._to_link(link[0],link[1]))
                 
     def _set_link(self,link,value):
         """Overrides parents method.
@@ -1316,37 +1683,79 @@ class FlatMultilayerNetworkView(MultilayerNetwork):
         raise NotImplemented("yet.")
 
 class ModularityMultilayerNetworkView(MultilayerNetwork):
+    _transient=('_to_n1','_to_n2','_to_link','_to_full_link') #the snapshot is pickled with the view
+
     def __init__(self,mnet,gamma=1.0):
         self.gamma=gamma
         self.mnet=mnet
 
         self.slices=mnet.slices
         self.aspects=mnet.aspects
+        self._init_link_getters()
 
-        #precalc ms,u
-        self.m={}
-        for s in itertools.product(*mnet.slices[1:]):
-            for node in mnet:
-                self.m[s]=self.m.get(s,0)+mnet[(node,)+s][(COLON,)+s].str()
-            self.m[s]=self.m[s]/2.0
-        self.u=0
-        for i in itertools.product(*mnet.slices):
-            for j in itertools.product(*mnet.slices):
-                self.u+=mnet[i][j]
+        #precalc ms, u and the intra-layer strengths of the nodes from the
+        #CSR snapshot of the network
+        import numpy
+        self._weights=mnet._get_exact_weights() #builds the snapshot, the kernels use float64
+        self._node2id=mnet._node2id
+        self._indptr,self._indices=mnet._indptr,mnet._indices
+        indptr,indices,weights=self._indptr,self._indices,self._weights
+        n=len(self._node2id)
+        layer_ids=dict((s,i) for i,s in enumerate(itertools.product(*mnet.slices[1:])))
+        self._layer_of_node=numpy.fromiter((layer_ids[node[1:]] for node in self._node2id),dtype=numpy.int64,count=n)
+
+        ids=numpy.repeat(numpy.arange(n,dtype=numpy.int64),numpy.diff(indptr))
+        intra=self._layer_of_node[ids]==self._layer_of_node[indices]
+        #bincount of an empty array is int64 even with weights
+        self._strength=numpy.bincount(ids[intra],weights=weights[intra],minlength=n).astype(numpy.float64)
+        if mnet.directed: #strength is the sum of in- and out-strength
+            self._strength+=numpy.bincount(indices[intra],weights=weights[intra],minlength=n)
+        self._m_by_layer=numpy.bincount(self._layer_of_node,weights=self._strength,minlength=len(layer_ids)).astype(numpy.float64)/2.0
+
+        self.m=dict((s,float(self._m_by_layer[i])) for s,i in layer_ids.items())
+        self.u=float(weights.sum())
         self.oneper2u=1.0/self.u/2.0
 
     def _get_link(self,item):
-        v=self.mnet[item]
+        v=self.mnet._get_link(item)
 
         if item[2::2]==item[3::2]: #its inside slice
             s=item[2::2]
-            kis=self.mnet[(item[0],)+s][(COLON,)+s].str()
-            kjs=self.mnet[(item[1],)+s][(COLON,)+s].str()
-            ms=self.m[s]
-            return v-self.gamma*kis*kjs/float(2.0*ms)
+            i,j=self._node2id.get((item[0],)+s),self._node2id.get((item[1],)+s)
+            if i is None or j is None: #zero strength
+                return v
+            ms=self._m_by_layer[self._layer_of_node[i]]
+            if ms==0: #no intra-layer links
+                return v
+            return v-self.gamma*self._strength[i]*self._strength[j]/(2.0*ms)
         else:
             return v
 
+    def _get_links_batch(self,links):
+        """Overrides parents method.
+        """
+        links=list(links)
+        weights=self.mnet._get_links_batch(links)
+        src,dst=self._links_to_ids(links)
+        layer_src=self._layer_of_node[src]
+        ms=self._m_by_layer[layer_src]
+        intra=(src>=0)&(dst>=0)&(layer_src==self._layer_of_node[dst])&(ms!=0)
+        i,j=src[intra],dst[intra]
+        weights[intra]-=self.gamma*self._strength[i]*self._strength[j]/(2.0*ms[intra])
+        return weights
+
+    def get_supra_adjacency_matrix(self,includeCouplings=True):
+        """Returns the supra-modularity matrix and a list of node-layer pairs.
+
+        See MultilayerNetwork.get_supra_adjacency_matrix.
+        """
+        import numpy
+        from pymnet import _kernels
+        nodes,pos=self._get_supra_positions()
+        matrix=self._init_supra_matrix(nodes,includeCouplings,self.mnet.noEdge)
+        _kernels.modularity_dense(self._indptr,self._indices,self._weights,pos,self._strength,self._m_by_layer,self._layer_of_node,float(self.gamma),not includeCouplings,matrix)
+        return matrix,nodes
+
 
 try:
     import networkx
@@ -293,6 +293,7 @@ class TestCC(unittest.TestCase):
             import numpy
             adj,nodes1=net.get_supra_adjacency_matrix()    
             a,nodes2=net.get_supra_adjacency_matrix(includeCouplings=False)
+            adj,a=numpy.matrix(adj),numpy.matrix(a)
             c=adj-a
             i=numpy.eye(len(a))
             ch=c+i
@@ -344,6 +345,7 @@ class TestCC(unittest.TestCase):
 
             anet=transforms.aggregate(net,1)
             w,nodes1=anet.get_supra_adjacency_matrix()
+            w=numpy.matrix(w)
 
             m=ch*a*ch
             saw=m*m*m
@@ -136,6 +136,113 @@ Data:
         n[1,2,3,3]=1
         self.assertEqual(pickle.loads(pickle.dumps(n)),n)
 
+    def test_pickle_protocols(self):
+        import pickle
+        mnet=net.MultilayerNetwork(aspects=1,directed=True,fullyInterconnected=False)
+        mnet[1,2,'a','b']=2
+        mplex=net.MultiplexNetwork(couplings=['categorical','ordinal'])
+        mplex[1,2,'a',1]=3
+        mplex.add_layer(2,2)
+        for protocol in range(pickle.HIGHEST_PROTOCOL+1):
+            for n in [mnet,mplex]:
+                copy=pickle.loads(pickle.dumps(n,protocol))
+                self.assertEqual(copy,n)
+                self.assertEqual(sorted(copy.edges),sorted(n.edges))
+            self.assertEqual(pickle.loads(pickle.dumps(mplex,protocol))[1,1,'a','a',1,2],1)
+
+    def test_pickle_without_snapshot(self):
+        import pickle
+        for n in [net.MultilayerNetwork(aspects=1),net.MultiplexNetwork(couplings='categorical')]:
+            n[1,2,'a','a']=1
+            n[2,3,'b','b']=2
+            p=pickle.dumps(n)
+            n.get_supra_adjacency_matrix()
+            self.assertEqual(pickle.dumps(n),p)
+            copy=pickle.loads(p)
+            self.assertTrue(copy._indptr is None)
+            self.assertEqual(copy.get_supra_adjacency_matrix()[0].tolist(),n.get_supra_adjacency_matrix()[0].tolist())
+
+        n=net.MultilayerNetwork(aspects=1)
+        n[1,2,'a','a']=1
+        h=hash(n)
+        n.get_supra_adjacency_matrix()
+        self.assertEqual(hash(n),h)
+
+        mod=net.ModularityMultilayerNetworkView(n)
+        copy=pickle.loads(pickle.dumps(mod))
+        self.assertEqual(copy[1,2,'a'],mod[1,2,'a'])
+
+    def test_pickle_from_older_versions(self):
+        import pickle
+        #MultiplexNetwork(couplings='categorical') with links (1,2,'a') and 
+        #(2,3,'b'), pickled with protocol 0 before the intra-layer networks
+        #were keyed by layer tuples
+        p=(b"ccopy_reg\n_reconstructor\np0\n(cpymnet.net\nMultiplexNetwork\np1\n"
+            b"c__builtin__\nobject\np2\nNtp3\nRp4\n(dp5\nVdirected\np6\nI00\n"
+            b"sVnoEdge\np7\nI0\nsVfullyInterconnected\np8\nI01\nsVcouplings\np9\n"
+            b"(lp10\n(Vcategorical\np11\nF1.0\ntp12\nasVaspects\np13\nI1\nsVslices\n"
+            b"p14\n(lp15\nc__builtin__\nset\np16\n((lp17\nI1\naI2\naI3\natp18\nRp19\n"
+            b"ag16\n((lp20\nVa\np21\naVb\np22\natp23\nRp24\nasVintranets\np25\ng0\n"
+            b"(cpymnet.net\nMultiplexIntraNetDict\np26\ng2\nNtp27\nRp28\n(dp29\n"
+            b"V_net\np30\ng4\nsV_dict\np31\n(dp32\ng21\ng0\n(cpymnet.net\n"
+            b"MultilayerNetworkWithParent\np33\ng2\nNtp34\nRp35\n(dp36\ng13\nI0\nsg6\n"
+            b"I00\nsg7\nI0\nsg14\n(lp37\ng19\nasg8\nI01\nsg30\n(dp38\n(I1\ntp39\n"
+            b"(dp40\n(I2\ntp41\nI1\nssg41\n(dp42\ng39\nI1\nsssVparent\np43\ng4\n"
+            b"sbsg22\ng0\n(g33\ng2\nNtp44\nRp45\n(dp46\ng13\nI0\nsg6\nI00\nsg7\nI0\n"
+            b"sg14\n(lp47\ng19\nasg8\nI01\nsg30\n(dp48\n(I2\ntp49\n(dp50\n(I3\ntp51\n"
+            b"I2\nssg51\n(dp52\ng49\nI2\nsssg43\ng4\nsbssbsVA\np53\ng28\nsb.")
+        n=pickle.loads(p)
+        self.assertEqual(n[1,2,'a'],1)
+        self.assertEqual(n[2,3,'b'],2)
+        self.assertEqual(n[1,1,'a','b'],1.0)
+        self.assertEqual(n.A['a'][1,2],1)
+        self.assertEqual(len(n.A['a'].edges),1)
+        n[3,4,'a']=3
+        self.assertEqual(n.A['a'][3,4],3)
+        matrix,nodes=n.get_supra_adjacency_matrix()
+        self.assertEqual(matrix[nodes.index((1,'a')),nodes.index((2,'a'))],1)
+
+        #MultilayerNetwork(aspects=1) with link (1,2,'a','b'), pickled with 
+        #protocol 0 before the dtype option
+        p=(b"ccopy_reg\n_reconstructor\np0\n(cpymnet.net\nMultilayerNetwork\np1\n"
+            b"c__builtin__\nobject\np2\nNtp3\nRp4\n(dp5\nVaspects\np6\nI1\n"
+            b"sVdirected\np7\nI00\nsVnoEdge\np8\nI0\nsVslices\np9\n(lp10\n"
+            b"c__builtin__\nset\np11\n((lp12\nI1\naI2\natp13\nRp14\nag11\n((lp15\nVa\n"
+            b"p16\naVb\np17\natp18\nRp19\nasVfullyInterconnected\np20\nI01\nsV_net\n"
+            b"p21\n(dp22\n(I1\ng16\ntp23\n(dp24\n(I2\ng17\ntp25\nI2\nssg25\n(dp26\n"
+            b"g23\nI2\nsssb.")
+        n=pickle.loads(p)
+        self.assertEqual(n[1,2,'a','b'],2)
+        matrix,nodes=n.get_supra_adjacency_matrix()
+        self.assertEqual(matrix[nodes.index((1,'a')),nodes.index((2,'b'))],2)
+
+    def test_pickle_in_new_process(self):
+        import pickle,subprocess,os
+        nets=[]
+        for aspects in range(4):
+            n=net.MultilayerNetwork(aspects=aspects)
+            n[(1,2)+aspects*('a','a')]=1
+            n[(2,3)+aspects*('a','b')]=2
+            nets.append(n)
+        n=net.MultiplexNetwork(couplings=['categorical','ordinal'])
+        n[1,2,'a',1]=3
+        nets.append(n)
+        nets.append(net.FlatMultilayerNetworkView(nets[2]))
+
+        #the links are read in a process where no network has been created
+        code=("import sys,pickle\n"
+              "nets=pickle.load(getattr(sys.stdin,'buffer',sys.stdin))\n"
+              "for n in nets[:-1]: sys.stdout.write(repr(sorted(n.edges))+'\\n')\n"
+              "sys.stdout.write(repr(nets[-1][(1,'a','a'),(2,'a','a')])+'\\n')\n")
+        env=dict(os.environ)
+        root=os.path.dirname(os.path.dirname(os.path.abspath(net.__file__)))
+        env["PYTHONPATH"]=os.pathsep.join([root]+([env["PYTHONPATH"]] if "PYTHONPATH" in env else []))
+        p=subprocess.Popen([sys.executable,"-c",code],stdin=subprocess.PIPE,stdout=subprocess.PIPE,stderr=subprocess.PIPE,env=env)
+        out,err=p.communicate(pickle.dumps(nets,2))
+        self.assertEqual(p.returncode,0,err)
+        expected=[repr(sorted(n.edges)) for n in nets[:-1]]+[repr(nets[-1][(1,'a','a'),(2,'a','a')])]
+        self.assertEqual(out.decode().splitlines(),expected)
+
 
 
 def test_io():
@@ -144,6 +251,10 @@ def test_io():
     suite.addTest(TestIO("test_read_ucinet_mplex_fullnet"))
     suite.addTest(TestIO("test_read_ucinet_mplex_nonglobalnodes"))
     suite.addTest(TestIO("test_pickle"))
+    suite.addTest(TestIO("test_pickle_protocols"))
+    suite.addTest(TestIO("test_pickle_without_snapshot"))
+    suite.addTest(TestIO("test_pickle_from_older_versions"))
+    suite.addTest(TestIO("test_pickle_in_new_process"))
 
     return unittest.TextTestRunner().run(suite).wasSuccessful() 
 
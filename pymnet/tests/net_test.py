@@ -322,6 +322,15 @@ class TestNet(unittest.TestCase):
         testnet=net.MultiplexNetwork(couplings=[('ordinal',1.0)])
         self.test_simple_couplings(testnet)
 
+    def test_changing_couplings_mplex(self):
+        mplex=net.MultiplexNetwork(couplings='categorical')
+        mplex[1,2,'a']=1
+        mplex.add_layer('b')
+        self.assertEqual(mplex[1,1,'a','b'],1)
+        mplex.couplings[0]=('categorical',0)
+        self.assertEqual(mplex[1,1,'a','b'],0)
+        self.assertEqual(sorted(mplex.edges),[(1,2,'a','a',1)])
+
     def test_simple_couplings_cmnet_add_to_A(self):
         """test_simple_couplings with links added to the net.A matrices directly.
         """
@@ -891,8 +900,316 @@ class TestNet(unittest.TestCase):
 
         self.assertEqual(len(mnet.edges),len(list(mnet.edges))) #this should always be true
         self.assertEqual(len(list(mnet.edges)),3) #self-edges only once in the edge list
+
+    def test_csr_snapshot(self):
+        """Testing that the CSR snapshot agrees with the network.
+        """
+        def check(mnet):
+            mnet._freeze()
+            nodes=list(mnet._node2id)
+            for i,node1 in enumerate(nodes):
+                lo,hi=mnet._indptr[i],mnet._indptr[i+1]
+                self.assertEqual(list(mnet._indices[lo:hi]),sorted(mnet._indices[lo:hi]))
+                for j,node2 in enumerate(nodes):
+                    w=mnet._get_link(mnet._nodes_to_link(node1,node2))
+                    found=[k for k in range(lo,hi) if mnet._indices[k]==j]
+                    if w==mnet.noEdge:
+                        self.assertEqual(found,[])
+                    else:
+                        self.assertEqual(len(found),1)
+                        self.assertEqual(mnet._weights[found[0]],w)
+
+        for directed in [False,True]:
+            mnet=net.MultilayerNetwork(aspects=1,directed=directed)
+            mnet[1,2,'a','a']=1
+            mnet[2,3,'a','b']=2
+            mnet[3,3,'b','b']=3
+            check(mnet)
+            mnet[1,2,'a','a']=0 #snapshot must be rebuilt after changes
+            mnet[1,3,'a','b']=4
+            check(mnet)
+
+            mplex=net.MultiplexNetwork(couplings=['categorical','ordinal'],directed=directed)
+            mplex[1,2,'a',1]=1
+            mplex[2,3,'b',2]=2
+            mplex.add_layer(3,aspect=2)
+            check(mplex)
+
+    def test_csr_snapshot_dtype(self):
+        import numpy,itertools
+        for mnet in [net.MultilayerNetwork(aspects=1,dtype=numpy.float32),net.MultiplexNetwork(couplings='categorical',dtype=numpy.float32)]:
+            mnet[1,2,'a','a']=0.5
+            mnet[2,3,'a','a']=2
+            mnet[1,2,'b','b']=1
+            mnet._freeze()
+            self.assertEqual(mnet._weights.dtype,numpy.float32)
+            matrix,nodes=mnet.get_supra_adjacency_matrix()
+            self.assertEqual(matrix.dtype,numpy.float64)
+            for (i_index,i),(j_index,j) in itertools.product(enumerate(nodes),repeat=2):
+                self.assertEqual(matrix[i_index,j_index],mnet[i][j])
+            self.assertEqual(list(mnet._get_links_batch([(1,2,'a','a'),(3,2,'a','a')])),[0.5,2])
+
+        #only the matrices have reduced precision
+        import tempfile,os
+        from pymnet import cc
+        def results(dtype):
+            mnet=net.MultilayerNetwork(aspects=0,dtype=dtype)
+            mnet[1,2]=0.1
+            mnet[2,3]=0.3
+            mnet[1,3]=1
+            links=[(1,2),(2,3),(1,3),(1,4)]
+            self.assertEqual(list(mnet._get_links_batch(links)),[mnet._get_link(link) for link in links])
+            fd,filename=tempfile.mkstemp()
+            try:
+                mnet._write_flattened(os.fdopen(fd,"w"))
+                with open(filename) as f:
+                    self.assertEqual(f.readline().split(),["0","0.1","1"])
+            finally:
+                os.remove(filename)
+
+            mplex=net.MultiplexNetwork(couplings=('categorical',0.1),dtype=dtype)
+            mplex[1,2,'a']=0.1
+            mplex[2,3,'b']=0.3
+            mod=net.ModularityMultilayerNetworkView(mplex)
+            return [cc.gcc_zhang(mnet),mod.u]+[mod[link] for link in [(1,2,'a','a'),(1,3,'b','b'),(2,2,'a','b')]]
+        self.assertEqual(results(numpy.float32),results(None))
+
+    def test_supra_adjacency_matrix(self):
+        import itertools
+        mnet=net.MultiplexNetwork(couplings=('categorical',0.5))
+        mnet[1,2,'a']=2
+        mnet[2,3,'b']=3
+        matrix,nodes=mnet.get_supra_adjacency_matrix()
+        self.assertEqual(nodes,[(1,'a'),(2,'a'),(3,'a'),(1,'b'),(2,'b'),(3,'b')])
+        self.assertEqual(matrix.tolist(),[[0,2,0,0.5,0,0],
+                                          [2,0,0,0,0.5,0],
+                                          [0,0,0,0,0,0.5],
+                                          [0.5,0,0,0,0,0],
+                                          [0,0.5,0,0,0,3],
+                                          [0,0,0.5,0,3,0]])
+        matrix,nodes=mnet.get_supra_adjacency_matrix(includeCouplings=False)
+        self.assertEqual(matrix.tolist(),[[0,2,0,0,0,0],
+                                          [2,0,0,0,0,0],
+                                          [0,0,0,0,0,0],
+                                          [0,0,0,0,0,0],
+                                          [0,0,0,0,0,3],
+                                          [0,0,0,0,3,0]])
+
+        mnet=net.MultilayerNetwork(aspects=0,directed=True)
+        mnet[1,1]=4
+        mnet[1,2]=2
+        mnet[3,1]=1
+        matrix,nodes=mnet.get_supra_adjacency_matrix()
+        self.assertEqual(nodes,[1,2,3])
+        self.assertEqual(matrix.tolist(),[[0,2,0],[0,0,0],[1,0,0]])
+
+        #missing links are noEdge, except for the diagonal of monoplex networks
+        #and the excluded inter-layer links
+        mnet=net.MultilayerNetwork(aspects=1,noEdge=-1)
+        mnet[1,2,'a','a']=2
+        mnet[1,1,'a','b']=0.5
+        for includeCouplings in [True,False]:
+            matrix,nodes=mnet.get_supra_adjacency_matrix(includeCouplings=includeCouplings)
+            for (i_index,i),(j_index,j) in itertools.product(enumerate(nodes),repeat=2):
+                if includeCouplings or i[1]==j[1]:
+                    self.assertEqual(matrix[i_index,j_index],mnet[i][j])
+                else:
+                    self.assertEqual(matrix[i_index,j_index],0)
+        self.assertEqual(matrix[nodes.index((1,'a')),nodes.index((1,'a'))],-1)
+
+        mnet=net.MultilayerNetwork(aspects=0,noEdge=-1)
+        mnet[1,2]=2
+        mnet[2,3]=1
+        matrix,nodes=mnet.get_supra_adjacency_matrix()
+        self.assertEqual(matrix.tolist(),[[0,2,-1],[2,0,1],[-1,1,0]])
+
+
+    def test_modularity_view(self):
+        """Testing the modularity matrix view against its definition.
+        """
+        import itertools
+        for directed in [False,True]:
+            mnet=net.MultiplexNetwork(couplings=('categorical',0.5),directed=directed)
+            mnet[1,2,'a']=1
+            mnet[2,3,'a']=2
+            mnet[1,3,'b']=1
+            mnet[3,4,'b']=3
+            mnet.add_layer('c')
+            mod=net.ModularityMultilayerNetworkView(mnet,gamma=0.5)
+
+            u=sum(mnet[i][j] for i in itertools.product(*mnet.slices) for j in itertools.product(*mnet.slices))
+            self.assertEqual(mod.u,u)
+            for s in ['a','b']:
+                m=sum(mnet[i,s][:,s].str() for i in mnet)/2.0
+                self.assertEqual(mod.m[(s,)],m)
+                for i,j in itertools.product(mnet.slices[0],repeat=2):
+                    b=mnet[i,j,s]-0.5*mnet[i,s][:,s].str()*mnet[j,s][:,s].str()/(2.0*m)
+                    self.assertAlmostEqual(mod[i,j,s],b)
+            self.assertEqual(mod[1,1,'a','b'],0.5)
+
+            matrix,nodes=mod.get_supra_adjacency_matrix()
+            for (i_index,i),(j_index,j) in itertools.product(enumerate(nodes),repeat=2):
+                self.assertAlmostEqual(matrix[i_index,j_index],mod[i][j])
+
+            links=[mnet._nodes_to_link(i,j) for i,j in itertools.product(nodes,repeat=2)]
+            for w,link in zip(mod._get_links_batch(links),links):
+                self.assertAlmostEqual(w,mod._get_link(link))
+
+        #only inter-layer links, the kernels take the strengths as float64
+        import numpy
+        for directed in [False,True]:
+            mnet=net.MultilayerNetwork(aspects=1,directed=directed)
+            mnet[1,2,'a','b']=1
+            mod=net.ModularityMultilayerNetworkView(mnet)
+            self.assertEqual(mod._strength.dtype,numpy.float64)
+            self.assertEqual(mod._m_by_layer.dtype,numpy.float64)
+            matrix,nodes=mod.get_supra_adjacency_matrix()
+            for (i_index,i),(j_index,j) in itertools.product(enumerate(nodes),repeat=2):
+                self.assertEqual(matrix[i_index,j_index],mod[i][j])
+
+    def test_link_conversions(self):
+        import pickle
+        for aspects in range(4):
+            mnet=net.MultilayerNetwork(aspects=aspects)
+            node1,node2=tuple(range(0,2*(aspects+1),2)),tuple(range(1,2*(aspects+1),2))
+            link=tuple(range(2*(aspects+1)))
+            self.assertEqual(mnet._nodes_to_link(node1,node2),link)
+            self.assertEqual(mnet._link_to_nodes(link),(node1,node2))
+            mnet[link]=1
+            self.assertEqual(pickle.loads(pickle.dumps(mnet))[link],1)
+
+    def test_flat_view_links(self):
+        mnet=net.MultiplexNetwork(couplings=['categorical','categorical'])
+        mnet[1,2,'a','a','x','x']=2
+        mnet.add_layer('b',1)
+        fnet=net.FlatMultilayerNetworkView(mnet)
+        self.assertEqual(fnet[(1,'a','x'),(2,'a','x')],2)
+        self.assertEqual(fnet[(1,'a','x'),(1,'b','x')],1)
+        self.assertEqual(fnet[(1,'a','x'),(2,'b','x')],0)
+
+        mono=net.MultilayerNetwork(aspects=0)
+        mono[1,2]=3
+        self.assertEqual(net.FlatMultilayerNetworkView(mono)[(1,),(2,)],3)
+
+    def test_get_links_batch(self):
+        mnet=net.MultilayerNetwork(aspects=1,directed=True)
+        mnet[1,2,'a','a']=1
+        mnet[2,1,'a','b']=2.5
+        mnet[3,1,'b','b']=3
+        links=[(1,2,'a','a'),(2,1,'a','a'),(2,1,'a','b'),(3,1,'b','b'),(1,3,'b','b'),(5,1,'a','a'),(1,1,'a','a')]
+        self.assertEqual(list(mnet._get_links_batch(links)),[1,0,2.5,3,0,0,0])
+        self.assertEqual(len(net.MultilayerNetwork(aspects=1)._get_links_batch(links)),len(links))
+
+        mplex=net.MultiplexNetwork(couplings=['categorical'])
+        mplex[1,2,'a']=1
+        mplex[2,3,'b']=2
+        self.assertEqual(list(mplex._get_links_batch(link for link in links+[(2,2,'a','b')])),[1,1,0,0,0,0,0,1])
+
+
+    def test_write_flattened(self):
+        import tempfile,os
+        def write(mnet):
+            fd,filename=tempfile.mkstemp()
+            try:
+                mnet._write_flattened(os.fdopen(fd,"w"))
+                with open(filename) as f:
+                    return [line.split() for line in f]
+            finally:
+                os.remove(filename)
+
+        for noEdge in [0,0.0,"-"]:
+            mnet=net.MultilayerNetwork(aspects=1,noEdge=noEdge)
+            mnet[1,1,'a','a']=2
+            mnet[1,2,'a','b']=0.5
+            mnet[2,1,'a','b']=3
+            mnet[2,2,'a','a']=0.1
+            mnet[1,1,'b','b']=2.0
+            n=str(noEdge)
+            self.assertEqual(write(mnet),[["2",n,n,"0.5"],
+                                          [n,"0.1","3",n],
+                                          [n,"3","2.0",n],
+                                          ["0.5",n,n,n]])
+
+    def test_2dim_categorical_dim_degree_nonglobalnodes(self):
+        n=net.MultiplexNetwork(couplings=['categorical','categorical'],fullyInterconnected=False)
+        n['a','b','x','x','p','p']=1
+        n['a','c','y','y','p','p']=2
+        n['a','c','x','x','q','q']=3
+        self.assertEqual(n._get_dim_degree(('a','x','p'),1),1)
+        self.assertEqual(n._get_dim_degree(('a','x','p'),2),1)
+        self.assertEqual(n._get_strength_out(('a','x','p'),None),3)
+        self.assertEqual(n.A['x','p']._get_strength_out(('a',)),1)
+        self.assertEqual(n.A['y','p']._get_strength_out(('c',)),2)
+        for node in n.iter_node_layers():
+            self.assertEqual(len(list(n[node])),n[node].deg())
+        self.assertEqual(sorted(n[('a','y','p')]),[('a','x','p'),('c','y','p')])
         
 
+    def test_mplex_lazy_intralayer_nets(self):
+        mnet=net.MultiplexNetwork(couplings=['categorical','categorical'])
+        for l in ['a','b','c']:
+            mnet.add_layer(l,1)
+        for l in ['x','y']:
+            mnet.add_layer(l,2)
+        mnet[1,2,'a','a','x','x']=1
+        self.assertEqual(len(mnet.A._dict),1)
+        self.assertEqual(len(mnet.A),6)
+        self.assertEqual(set(mnet.A),set([(l1,l2) for l1 in ['a','b','c'] for l2 in ['x','y']]))
+        self.assertTrue(('c','y') in mnet.A)
+        self.assertFalse(('c','z') in mnet.A)
+        self.assertFalse('c' in mnet.A)
+        self.assertEqual(mnet[1,2,'b','b','y','y'],0)
+        self.assertEqual(mnet[1,1,'a','b','x','x'],1)
+        self.assertEqual(len(list(mnet.edges)),1+2*2*3+2*3*1) #intra, couplings in aspects 1 and 2
+        self.assertEqual(len(mnet.A._dict),1)
+        self.assertEqual(list(mnet.A['c','y'].edges),[])
+        self.assertRaises(KeyError,lambda:mnet.A['c','z'])
+        self.assertRaises(KeyError,lambda:mnet.A[5])
+
+        #keys are normalized to tuples
+        self.assertTrue(mnet.A[['b','x']] is mnet.A['b','x'])
+        self.assertEqual(len(mnet.A._dict),3)
+        self.assertFalse('ax' in mnet.A)
+        self.assertRaises(KeyError,lambda:mnet.A['ax'])
+        self.assertEqual(len(mnet.A._dict),3)
+
+        #comparison doesn't create the missing networks
+        def build():
+            n=net.MultiplexNetwork(couplings=['categorical','categorical'],fullyInterconnected=False)
+            for l1 in range(10):
+                for l2 in range(10):
+                    n.add_layer(l1,1)
+                    n.add_layer(l2,2)
+            n[1,2,0,0,0,0]=1
+            return n
+        n1,n2=build(),build()
+        self.assertEqual(n1,n2)
+        self.assertEqual((len(n1.A._dict),len(n2.A._dict)),(1,1))
+        n2.A[5,5]
+        self.assertEqual(n1,n2)
+        n2[1,2,5,5,5,5]=1
+        self.assertNotEqual(n1,n2)
+
+        #nor does iterating over neighbors
+        self.assertEqual(list(n1[1,0,0]),[(2,0,0)])
+        self.assertEqual(list(n1[1,4,4]),[])
+        self.assertEqual(len(n1.A._dict),1)
+
+    def test_ordinal_couplings_mplex_nonglobalnodes(self):
+        n=net.MultiplexNetwork(couplings=['ordinal'],fullyInterconnected=False)
+        n['a','b',1,1]=1
+        n['a','b',2,2]=1
+        n['c','b',3,3]=1
+        self.assertEqual(n[('a',2)].deg(),2)
+        self.assertEqual(sorted(n[('a',2)]),[('a',1),('b',2)])
+        self.assertEqual(n[('c',3)].deg(),1)
+
+        n=net.MultiplexNetwork(couplings=['ordinal','categorical'],fullyInterconnected=False)
+        n['a','b',1,1,'x','x']=1
+        n['a','b',2,2,'x','x']=1
+        self.assertEqual(n[('a',2,'x')].deg(),2)
+        self.assertEqual(sorted(n[('a',2,'x')]),[('a',1,'x'),('b',2,'x')])
+
 
 def test_net():
     suite = unittest.TestSuite()    
@@ -905,6 +1222,7 @@ def test_net():
     suite.addTest(TestNet("test_simple_couplings_categorical_mplex"))
     suite.addTest(TestNet("test_simple_couplings_ordinal_mplex"))
     suite.addTest(TestNet("test_simple_couplings_cmnet_add_to_A"))
+    suite.addTest(TestNet("test_changing_couplings_mplex"))
     suite.addTest(TestNet("test_2dim_categorical_couplings_mnet"))
     suite.addTest(TestNet("test_2dim_categorical_couplings_cmnet"))
     suite.addTest(TestNet("test_network_coupling_mnet"))
@@ -918,6 +1236,17 @@ def test_net():
     suite.addTest(TestNet("test_mlayer_2dim_nonglobalnodes"))
     suite.addTest(TestNet("test_mplex_adding_intralayer_nets"))
     suite.addTest(TestNet("test_selfedges"))
+    suite.addTest(TestNet("test_csr_snapshot"))
+    suite.addTest(TestNet("test_supra_adjacency_matrix"))
+    suite.addTest(TestNet("test_csr_snapshot_dtype"))
+    suite.addTest(TestNet("test_modularity_view"))
+    suite.addTest(TestNet("test_get_links_batch"))
+    suite.addTest(TestNet("test_link_conversions"))
+    suite.addTest(TestNet("test_flat_view_links"))
+    suite.addTest(TestNet("test_write_flattened"))
+    suite.addTest(TestNet("test_2dim_categorical_dim_degree_nonglobalnodes"))
+    suite.addTest(TestNet("test_mplex_lazy_intralayer_nets"))
+    suite.addTest(TestNet("test_ordinal_couplings_mplex_nonglobalnodes"))
         
     return unittest.TextTestRunner().run(suite).wasSuccessful()
 
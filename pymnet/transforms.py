@@ -244,7 +244,7 @@ def supra_adjacency_matrix(net,includeCouplings=True):
 
     Returns
     -------
-    matrix, nodes : numpy.matrix, list
+    matrix, nodes : numpy.ndarray, list
        The supra-adjacency matrix and the list of node-layer pairs. The order
        of the elements in the list and the supra-adjacency matrix are the same.
     """